@@ -1,167 +1,460 @@
-from flask import Flask, jsonify
-import requests
+from flask import Flask, Response, jsonify, request
+from flask.json.provider import JSONProvider
+import asyncio
+import hashlib
+import httpx
+import ijson
+import logging
+import orjson
+import os
+import queue
+import threading
+import time
+from logging.handlers import QueueHandler, QueueListener
+from dataclasses import dataclass
+from functools import lru_cache
 from datetime import datetime, UTC
-from apscheduler.schedulers.background import BackgroundScheduler
+from apscheduler.schedulers.asyncio import AsyncIOScheduler
 
 app = Flask(__name__)
 
-# ✅ Define NOAA API URL for cyclone data
-NOAA_URL = "https://api.weather.gov/products/types/TCM"  # Replace with actual NOAA API for live cyclone data
+# ✅ Non-blocking logging: records go onto an unbounded queue and a listener
+# thread does the actual stderr writes, so jobs never wait on the stdout lock.
+# The QueueHandler carries raw records (no formatter — basicConfig would
+# attach one and bake its output into the message, formatting every line
+# twice); only the listener's stderr handler formats.
+_log_queue = queue.Queue(-1)
+_stderr_handler = logging.StreamHandler()
+_stderr_handler.setFormatter(logging.Formatter("[%(asctime)s] %(levelname)s %(message)s"))
+_root_logger = logging.getLogger()
+_root_logger.setLevel(logging.INFO)
+_root_logger.addHandler(QueueHandler(_log_queue))
+_log_listener = QueueListener(_log_queue, _stderr_handler)
+_log_listener.start()
+log = logging.getLogger(__name__)
+
+# ✅ orjson-backed JSON provider: faster encode/decode than stdlib json, same API for clients
+class OrjsonProvider(JSONProvider):
+    def dumps(self, obj, **kwargs):
+        return orjson.dumps(obj).decode()
+
+    def loads(self, s, **kwargs):
+        return orjson.loads(s)
+
+app.json = OrjsonProvider(app)
+
+class RetryTransport(httpx.AsyncHTTPTransport):
+    """AsyncHTTPTransport that also retries transient error statuses.
+
+    The base class's retries= only re-attempts connection failures; this
+    adds bounded exponential backoff on 429/5xx — the policy the requests
+    Session's urllib3 Retry provided before the httpx migration. Living at
+    the transport level, it covers streamed fetches and model POSTs alike.
+    """
+
+    RETRY_STATUSES = frozenset({429, 500, 502, 503, 504})
+
+    def __init__(self, *args, status_retries=3, backoff_factor=0.5, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.status_retries = status_retries
+        self.backoff_factor = backoff_factor
+
+    async def handle_async_request(self, request):
+        response = await super().handle_async_request(request)
+        for attempt in range(self.status_retries):
+            if response.status_code not in self.RETRY_STATUSES:
+                break
+            await response.aclose()
+            await asyncio.sleep(self.backoff_factor * (2 ** attempt))
+            response = await super().handle_async_request(request)
+        return response
+
+# ✅ Async HTTP client shared by all scheduler work (fetches and model sends):
+# one event loop overlaps the I/O and every call reuses one keep-alive pool
+# Pool limits and HTTP/2 must be configured on the transport: once an
+# explicit transport is passed, the client-level limits=/http2= are ignored
+HTTP_CLIENT = httpx.AsyncClient(
+    transport=RetryTransport(
+        retries=3,
+        http2=True,
+        limits=httpx.Limits(max_keepalive_connections=20, max_connections=100),
+    ),
+    timeout=httpx.Timeout(10, connect=3.05),
+    headers={
+        "User-Agent": "disaster-data-server/1.0 (contact: ops@example.com)",  # NOAA/USGS require a UA
+        "Accept-Encoding": "gzip, br",  # USGS GeoJSON compresses ~6-10x on the wire
+    },
+)
+
+# ✅ Define NOAA API URL for cyclone data (NHC's feed actually serves the
+# activeStorms schema; the old /products/types/TCM URL returned a product
+# listing that parsed to an empty list every tick)
+NOAA_URL = "https://www.nhc.noaa.gov/CurrentStorms.json"
 MODEL_ENDPOINT = "https://your-model-api-url.com/predict_cluster"  # Replace with your model's API
 
 # ✅ USGS API for Earthquake Data
 USGS_URL = "https://earthquake.usgs.gov/fdsnws/event/1/query"
- 
-# Global variables to store latest data
-latest_earthquake_data = []
-latest_cyclone_data = []
 
-def fetch_earthquake_data():
-    """Fetch latest earthquake data from USGS with comprehensive details."""
-    global latest_earthquake_data
+# ✅ Send all storms in one POST; set BATCH_MODEL_POSTS=0 if the model only accepts single storms
+BATCH_MODEL_POSTS = os.environ.get("BATCH_MODEL_POSTS", "1") == "1"
+
+class CircuitBreaker:
+    """Skip an endpoint for a cooldown window after repeated failures.
+
+    Keeps a flapping or down upstream from occupying a scheduler slot for
+    the full timeout-plus-retries on every tick.
+    """
+
+    def __init__(self, threshold=3, cooldown=120):
+        self.threshold = threshold
+        self.cooldown = cooldown
+        self.failures = 0
+        self.opened_at = None
 
-    params = {
+    def is_open(self):
+        if self.opened_at is None:
+            return False
+        if time.monotonic() - self.opened_at >= self.cooldown:
+            # Cooldown elapsed: let the next attempt probe the endpoint
+            self.opened_at = None
+            return False
+        return True
+
+    def record_success(self):
+        self.failures = 0
+        self.opened_at = None
+
+    def record_failure(self):
+        self.failures += 1
+        if self.failures >= self.threshold:
+            self.opened_at = time.monotonic()
+
+_usgs_breaker = CircuitBreaker()
+_noaa_breaker = CircuitBreaker()
+_model_breaker = CircuitBreaker()
+
+# Global variables to store latest data. Scheduler jobs publish these by
+# building the full collection locally and then rebinding the name in one
+# store (atomic under the GIL); tuples keep readers from ever observing a
+# half-built or mutated-in-place value from a Flask request thread.
+latest_earthquake_data = ()
+latest_cyclone_data = ()
+
+def _encode_cache(payload):
+    """Pre-serialize a payload to (bytes, etag) so endpoints serve it as-is."""
+    body = orjson.dumps(payload)
+    return body, hashlib.blake2b(body, digest_size=8).hexdigest()
+
+# ✅ Pre-serialized response bodies, refreshed by the scheduler jobs. The data
+# only changes every 10 minutes, so the request path is a plain bytes read.
+_eq_cache = _encode_cache(latest_earthquake_data)
+_cy_cache = _encode_cache(latest_cyclone_data)
+
+def _cached_json_response(cache):
+    body, etag = cache
+    headers = {"ETag": etag, "Cache-Control": "max-age=600"}
+    if request.headers.get("If-None-Match") == etag:
+        return Response(status=304, headers=headers)
+    return Response(body, mimetype="application/json", headers=headers)
+
+# Validators from the last USGS response, for conditional GETs
+_eq_etag = None
+_eq_last_modified = None
+
+@lru_cache(maxsize=8)
+def _usgs_params(today_iso):
+    """Query params for one UTC day; memoized so the dict is built once per day."""
+    return {
         "format": "geojson",
-        "starttime": datetime.now(UTC).strftime('%Y-%m-%d'),
-        "endtime": datetime.now(UTC).strftime('%Y-%m-%d'),
+        "starttime": today_iso,
+        "endtime": today_iso,
         "minmagnitude": 3.0,
         "orderby": "time-asc",  # Get oldest first
         "limit": 50,
         "eventtype": "earthquake"
     }
 
-    try:
-        response = requests.get(USGS_URL, params=params)
-        
-        if response.status_code == 200:
-            data = response.json()
-            extracted_data = []
+# ✅ Slotted records instead of 25-key dicts: no per-record hash table, less
+# memory, and orjson serializes dataclasses natively with the same JSON keys
+@dataclass(slots=True)
+class FocalMechanism:
+    strike: float | str
+    dip: float | str
+    rake: float | str
 
-            for feature in data["features"]:
-                properties = feature["properties"]
-                geometry = feature["geometry"]["coordinates"]
-                
-                # Extract detailed location information
-                place = properties.get("place", "N/A")
-                if ", " in place:
-                    region = place.split(", ")[-1]  # Get the region/country
-                else:
-                    region = place
-                
-                # Comprehensive earthquake information
-                earthquake_info = {
-                    # Basic info
-                    "id": feature.get("id"),
-                    "time": properties.get("time"),
-                    "updated": properties.get("updated"),
-                    
-                    # Magnitude details
-                    "magnitude": properties.get("mag"),
-                    "mag_type": properties.get("magType"),
-                    "magnitude_error": properties.get("magError", "N/A"),
-                    
-                    # Location details
-                    "latitude": geometry[1],
-                    "longitude": geometry[0],
-                    "depth_km": geometry[2],
-                    "depth_error": properties.get("depthError", "N/A"),
-                    "location": place,
-                    "region": region,
-                    
-                    # Seismic parameters
-                    "seismic_stations": properties.get("nst", "N/A"),
-                    "rms": properties.get("rms", "N/A"),  # Root mean square of travel time residuals
-                    "gap": properties.get("gap", "N/A"),    # Azimuthal gap between stations
-                    "dmin": properties.get("dmin", "N/A"),  # Horizontal distance to nearest station
-                    
-                    # Fault mechanism
-                    "focal_mechanism": {
-                        "strike": properties.get("strike", "N/A"),
-                        "dip": properties.get("dip", "N/A"),
-                        "rake": properties.get("rake", "N/A")
-                    },
-                    
-                    # Tsunami risk
-                    "tsunami_alert": 1 if properties.get("tsunami") else 0,
-                    "tsunami_warning": properties.get("alert", "N/A"),  # "green", "yellow", "red"
-                    
-                    # Additional metadata
-                    "event_type": properties.get("type"),
-                    "status": properties.get("status"),  # "automatic" or "reviewed"
-                    "url": properties.get("url")  # USGS detail page
-                }
+@dataclass(slots=True)
+class EarthquakeRecord:
+    """One earthquake, with fields in the order the API has always served."""
+    # Basic info
+    id: str | None
+    time: int | None
+    updated: int | None
+    # Magnitude details
+    magnitude: float | None
+    mag_type: str | None
+    magnitude_error: float | str
+    # Location details
+    latitude: float
+    longitude: float
+    depth_km: float
+    depth_error: float | str
+    location: str
+    region: str
+    # Seismic parameters
+    seismic_stations: int | str
+    rms: float | str    # Root mean square of travel time residuals
+    gap: float | str    # Azimuthal gap between stations
+    dmin: float | str   # Horizontal distance to nearest station
+    # Fault mechanism
+    focal_mechanism: FocalMechanism
+    # Tsunami risk
+    tsunami_alert: int
+    tsunami_warning: str  # "green", "yellow", "red"
+    # Additional metadata
+    event_type: str | None
+    status: str | None  # "automatic" or "reviewed"
+    url: str | None     # USGS detail page
 
-                extracted_data.append(earthquake_info)
+def _build_earthquake_record(feature):
+    """One earthquake record, in the shape the API has always served."""
+    properties = feature["properties"]
+    pg = properties.get  # bind once; saves an attribute lookup per field below
+    lon, lat, depth = feature["geometry"]["coordinates"]
 
-            latest_earthquake_data = extracted_data
-            print(f"[{datetime.now(UTC)}] ✅ Updated earthquake data ({len(extracted_data)} records)")
-        else:
-            print(f"❌ Failed to fetch earthquake data: HTTP {response.status_code}")
+    # Extract detailed location information. rpartition hands back the
+    # region/country tail (or the whole string when there is no comma)
+    # without allocating a list the way split does.
+    place = pg("place", "N/A")
+    region = place.rpartition(", ")[2] or place
+
+    return EarthquakeRecord(
+        feature.get("id"),
+        pg("time"),
+        pg("updated"),
+        pg("mag"),
+        pg("magType"),
+        pg("magError", "N/A"),
+        lat,
+        lon,
+        depth,
+        pg("depthError", "N/A"),
+        place,
+        region,
+        pg("nst", "N/A"),
+        pg("rms", "N/A"),
+        pg("gap", "N/A"),
+        pg("dmin", "N/A"),
+        FocalMechanism(pg("strike", "N/A"), pg("dip", "N/A"), pg("rake", "N/A")),
+        1 if pg("tsunami") else 0,
+        pg("alert", "N/A"),
+        pg("type"),
+        pg("status"),
+        pg("url")
+    )
+
+async def fetch_earthquake_data():
+    """Fetch latest earthquake data from USGS with comprehensive details."""
+    global latest_earthquake_data, _eq_cache, _eq_etag, _eq_last_modified
+
+    if _usgs_breaker.is_open():
+        log.warning("⚠️ USGS circuit open, skipping earthquake fetch.")
+        return
+
+    today = datetime.now(UTC).date().isoformat()
+    params = _usgs_params(today)
+
+    # Conditional GET: in steady state (no new quakes this interval) USGS
+    # answers 304 with an empty body and we skip the parse entirely
+    headers = {}
+    if _eq_etag:
+        headers["If-None-Match"] = _eq_etag
+    if _eq_last_modified:
+        headers["If-Modified-Since"] = _eq_last_modified
+
+    try:
+        async with HTTP_CLIENT.stream("GET", USGS_URL, params=params, headers=headers) as response:
+            if response.status_code == 304:
+                # USGS data unchanged since the last tick; keep what we have
+                _usgs_breaker.record_success()
+                log.info("✅ Earthquake data unchanged (304), keeping %d records", len(latest_earthquake_data))
+                return
+            if response.status_code != 200:
+                _usgs_breaker.record_failure()
+                log.error("❌ Failed to fetch earthquake data: HTTP %s", response.status_code)
+                return
+
+            # Build records as the (decompressed) bytes arrive instead of
+            # materializing the whole GeoJSON document in memory first
+            extracted_data = []
+            features = ijson.sendable_list()
+            # use_float: ijson otherwise yields decimal.Decimal for any
+            # fractional number, which orjson refuses to serialize
+            parser = ijson.items_coro(features, "features.item", use_float=True)
+            async for chunk in response.aiter_bytes():
+                parser.send(chunk)
+                if features:
+                    extracted_data.extend(_build_earthquake_record(f) for f in features)
+                    del features[:]
+            parser.close()
+
+            # Encode before publishing so a failure here leaves both stores
+            # untouched — the records tuple and the served bytes must never
+            # diverge. Then publish fully-built, immutable values in single
+            # stores. The validators are only adopted once the body has
+            # parsed and been stored; on a failed parse we must not
+            # revalidate against a response we never kept, or every later
+            # tick would 304 against stale data.
+            new_cache = _encode_cache(extracted_data)
+            latest_earthquake_data = tuple(extracted_data)
+            _eq_cache = new_cache
+            _eq_etag = response.headers.get("ETag")
+            _eq_last_modified = response.headers.get("Last-Modified")
+            _usgs_breaker.record_success()
+            log.info("✅ Updated earthquake data (%d records)", len(extracted_data))
     except Exception as e:
-        print(f"❌ Error fetching earthquake data: {str(e)}")
+        _usgs_breaker.record_failure()
+        log.error("❌ Error fetching earthquake data: %s", e)
 
-def fetch_cyclone_data():
+async def fetch_cyclone_data():
     """Fetch live cyclone data from NOAA."""
-    global latest_cyclone_data
+    global latest_cyclone_data, _cy_cache
+
+    if _noaa_breaker.is_open():
+        log.warning("⚠️ NOAA circuit open, skipping cyclone fetch.")
+        return
 
     try:
-        response = requests.get(NOAA_URL)
+        response = await HTTP_CLIENT.get(NOAA_URL)
         if response.status_code == 200:
-            data = response.json().get("activeStorms", [])
+            # Cheap bytes scan before the full JSON parse: a response that
+            # can't contain storms (wrong product, empty feed) is settled by
+            # a memchr-backed substring check instead of decoding the body
+            if b'"activeStorms"' not in response.content:
+                latest_cyclone_data = ()
+                _cy_cache = _encode_cache(latest_cyclone_data)
+                _noaa_breaker.record_success()
+                log.warning("⚠️ NOAA response has no activeStorms field, cleared cyclone data")
+                return
+
+            data = orjson.loads(response.content).get("activeStorms", [])
             extracted_data = []
 
             for storm in data:
                 storm_info = {
                     "ISO_TIME": storm.get("lastUpdate"),
-                    "LAT": storm.get("latitude_numeric"),
-                    "LON": storm.get("longitude_numeric"),
+                    "LAT": storm.get("latitudeNumeric"),
+                    "LON": storm.get("longitudeNumeric"),
                     "STORM_SPEED": storm.get("movementSpeed"),
                     "STORM_DIR": storm.get("movementDir")
                 }
                 extracted_data.append(storm_info)
 
-            latest_cyclone_data = extracted_data
-            print(f"[{datetime.now(UTC)}] ✅ Updated cyclone data ({len(extracted_data)} records)")
+            # Publish fully-built, immutable values in single stores
+            latest_cyclone_data = tuple(extracted_data)
+            _cy_cache = _encode_cache(extracted_data)
+            _noaa_breaker.record_success()
+            log.info("✅ Updated cyclone data (%d records)", len(extracted_data))
         else:
-            print(f"❌ Failed to fetch cyclone data: HTTP {response.status_code}")
+            _noaa_breaker.record_failure()
+            log.error("❌ Failed to fetch cyclone data: HTTP %s", response.status_code)
     except Exception as e:
-        print(f"❌ Error fetching cyclone data: {e}")
+        _noaa_breaker.record_failure()
+        log.error("❌ Error fetching cyclone data: %s", e)
 
-def send_data_to_model():
+async def send_data_to_model():
     """Send live cyclone data to ML model."""
     if not latest_cyclone_data:
-        print("⚠️ No cyclone data available.")
+        log.warning("⚠️ No cyclone data available.")
         return
 
-    for storm in latest_cyclone_data:
+    if _model_breaker.is_open():
+        log.warning("⚠️ Model endpoint circuit open, skipping send.")
+        return
+
+    if BATCH_MODEL_POSTS:
         try:
-            response = requests.post(MODEL_ENDPOINT, json=storm)
-            print(f"✅ Sent cyclone data to model: {response.status_code}")
+            response = await HTTP_CLIENT.post(MODEL_ENDPOINT, json={"storms": list(latest_cyclone_data)}, timeout=30)
+            _model_breaker.record_success()
+            log.info("✅ Sent %d storms to model in one batch: %s", len(latest_cyclone_data), response.status_code)
         except Exception as e:
-            print(f"❌ Error sending cyclone data: {e}")
+            _model_breaker.record_failure()
+            log.error("❌ Error sending cyclone data batch: %s", e)
+        return
+
+    results = await asyncio.gather(
+        *(HTTP_CLIENT.post(MODEL_ENDPOINT, json=storm) for storm in latest_cyclone_data),
+        return_exceptions=True
+    )
+    ok = sum(1 for result in results if not isinstance(result, Exception))
+    # One summary line instead of one write per POST
+    log.info("✅ Sent %d storms to model: %d ok, %d failed", len(results), ok, len(results) - ok)
+
+async def periodic():
+    """One scheduler tick: run both fetches in parallel, then the model send.
+
+    A single job means one wakeup per interval, and the send naturally runs
+    only after the cyclone fetch has resolved.
+    """
+    await asyncio.gather(fetch_earthquake_data(), fetch_cyclone_data())
+    await send_data_to_model()
+
+# 🔁 Combined scheduler-based approach: the jobs run as coroutines on one
+# event loop (in a daemon thread, since Flask itself stays WSGI), so all
+# fetches can progress while any one of them is waiting on NOAA/USGS.
+_loop = None
+_loop_pid = None
+_loop_lock = threading.Lock()
+
+def _ensure_loop():
+    """Return this process's running event loop, creating it on first use.
+
+    The loop and its thread are created lazily and keyed to the current pid:
+    threads do not survive fork, so a loop inherited from a gunicorn master
+    would be one nobody is running and anything submitted to it would hang.
+    """
+    global _loop, _loop_pid
+    with _loop_lock:
+        if _loop is None or _loop_pid != os.getpid():
+            _loop = asyncio.new_event_loop()
+            _loop_pid = os.getpid()
+            threading.Thread(target=_loop.run_forever, name="scheduler-loop", daemon=True).start()
+    return _loop
+
+def _start_scheduler():
+    loop = _ensure_loop()
+    scheduler = AsyncIOScheduler(event_loop=loop)
+    # max_instances/coalesce keep a stalled upstream from piling up overlapping
+    # runs: a tick that can't start within the grace window is collapsed into
+    # the next one rather than queued behind it.
+    scheduler.add_job(periodic, "interval", minutes=10, id="periodic",
+                      max_instances=1, coalesce=True, misfire_grace_time=120,
+                      replace_existing=True)
+    loop.call_soon_threadsafe(scheduler.start)
+    return scheduler
 
-# 🔁 Combined scheduler-based approach
-scheduler = BackgroundScheduler()
-scheduler.add_job(fetch_earthquake_data, "interval", minutes=10)
-scheduler.add_job(fetch_cyclone_data, "interval", minutes=10)
-scheduler.add_job(send_data_to_model, "interval", minutes=10)
-scheduler.start()
+# The caches are per-process memory, so every process that serves the data
+# endpoints must also run the refresh jobs; under gunicorn (no --preload)
+# each worker imports the app post-fork and gets its own scheduler. Set
+# RUN_SCHEDULER=0 only for tooling that imports the app without serving.
+if os.environ.get("RUN_SCHEDULER", "1") == "1":
+    scheduler = _start_scheduler()
 
 # 🧪 Flask endpoints for manual access/testing
 @app.route('/get_earthquake_data', methods=['GET'])
 def get_earthquake_data():
-    return jsonify(latest_earthquake_data)
+    return _cached_json_response(_eq_cache)
 
 @app.route('/get_cyclone_data', methods=['GET'])
 def get_cyclone_data():
-    return jsonify(latest_cyclone_data)
+    return _cached_json_response(_cy_cache)
 
 @app.route('/send_to_model', methods=['GET'])
 def trigger_model_send():
-    send_data_to_model()
+    asyncio.run_coroutine_threadsafe(send_data_to_model(), _ensure_loop()).result()
     return jsonify({"message": "Cyclone data sent to model."})
 
 if __name__ == '__main__':
-    fetch_earthquake_data()  # Initial fetch
-    fetch_cyclone_data()     # Initial fetch
-    app.run(debug=True, port=5001)
+    # Initial fetches, run on the scheduler's event loop
+    asyncio.run_coroutine_threadsafe(fetch_earthquake_data(), _ensure_loop()).result()
+    asyncio.run_coroutine_threadsafe(fetch_cyclone_data(), _ensure_loop()).result()
+    app.run(debug=False, port=5001)